@@ -1,13 +1,15 @@
 # %%
 from pathlib import Path as PathBase 
-from functools import reduce 
+from functools import reduce, lru_cache
 from datetime import date, datetime
 import pandas as pd 
 import numpy as np 
-import os 
-import sys 
-import time 
+import os
+import sys
+import time
 import csv
+import fnmatch
+import calendar
 from dateutil.relativedelta import relativedelta 
 from typing import Iterable, Self
 log = print 
@@ -32,23 +34,26 @@ def join(s: any, *ss, sep=SP, func=str) -> str:
     ss = [*s, *ss]
   else:
     ss = [s, *ss]
+  # すべて文字列ならstr()もジェネレータも通さず直接結合する
+  if func is str and all(type(x) is str for x in ss):
+    return sep.join(ss)
   return sep.join(func(x) for x in ss)
 
-def sand(s, a, b=None): 
+def sand(s, a, b=None):
   """
   文字列を指定した文字列で挟んで返す。
   """
-  return join(a, s, a if b is None else b, sep="")
+  return f"{a}{s}{a if b is None else b}"
 
 # log(join("aaa", "b", "c"))
 # log(join(111, "b", "c"))
 # log(join((234, "b") , "c"))
 
-def sq(s): return sand(s, SQ)
-def dq(s): return sand(s, DQ) 
-def paren(s): return sand(s, *PARENS)
-def bracket(s): return sand(s, *BRACKETS)
-def brace(s): return sand(s, *BRACES)
+def sq(s): return f"'{s}'"
+def dq(s): return f'"{s}"'
+def paren(s): return f"({s})"
+def bracket(s): return f"[{s}]"
+def brace(s): return f"{{{s}}}"
 def comma(s, *ss, **aa): return join(s, *ss, sep=COMMA, **aa)
 def bar(s, *ss, **aa): return join(s, *ss, sep=BAR, **aa)
 def under(s, *ss, **aa): return join(s, *ss, sep=UNDER, **aa)
@@ -79,6 +84,14 @@ UTF16 = "utf-16"
 UTF8BOM = "utf-8-sig"
 SJIS = "cp932"
 
+# pyarrowがあればCSVの読み書きに利用する(なければpandas既定のまま)
+try:
+  import pyarrow as pa
+  import pyarrow.csv as pacsv
+  HAS_PYARROW = True
+except ImportError:
+  HAS_PYARROW = False
+
 class Path(PathBase):
   """
   パスを操作するクラス。
@@ -89,8 +102,11 @@ class Path(PathBase):
   def parent(self) -> Self: 
     return type(self)(super().parent)
   @property
-  def parents(self) -> list[Self]:
-    return [type(self)(x) for x in super().parents]
+  def parents(self) -> Iterable[Self]:
+    # 全要素をリスト化せず、使われた分だけ遅延して包む
+    return (type(self)(x) for x in super().parents)
+  def parents_list(self) -> list[Self]:
+    return list(self.parents)
   def ensure_dir(self) -> Self: 
     super().mkdir(parents=True, exist_ok=True)
     return self 
@@ -114,8 +130,20 @@ class Path(PathBase):
     return type(self)(super().expanduser())
   def expandvars(self) -> Self: 
     return type(self)(super().expandvars())
-  def glob(self, pattern: str) -> Iterable[Self]: 
+  def glob(self, pattern: str) -> Iterable[Self]:
+    # ワイルドカードを含まないパターンは存在確認1回で済ませる
+    if not any(c in pattern for c in '*?['):
+      target = self / pattern
+      return iter((target,)) if target.exists() else iter(())
+    # 単一階層のパターンはos.scandirで直接走査する(globの中間処理を省く)
+    if '**' not in pattern and '/' not in pattern and os.sep not in pattern:
+      return self._scan(pattern)
     return (type(self)(x) for x in super().glob(pattern))
+  def _scan(self, pattern: str) -> Iterable[Self]:
+    with os.scandir(self) as it:
+      for entry in it:
+        if fnmatch.fnmatch(entry.name, pattern):
+          yield type(self)(self, entry.name)
   def rglob(self, pattern: str) -> Iterable[Self]: 
     return (type(self)(x) for x in super().rglob(pattern))
   def with_parts(self, *parts: str) -> Self: 
@@ -134,9 +162,9 @@ def fullpath(path: str | Path | Iterable[str], *paths, **aa) -> Path:
     paths = [*path, *paths]
   else:
     paths = [path, *paths]
-  root = Path(".")
-  full = reduce(lambda a, b: Path(a) / Path(b), paths, root)
-  return full.expanduser().resolve().absolute() 
+  # reduceで1要素ずつ連結するとPathを要素数ぶん生成してしまうため一括で構築する
+  full = Path(*paths)
+  return full.expanduser().resolve().absolute()
 
 # log(fullpath("..", "hoge", "fuga", "piyo"))
 # log(fullpath(("..", "hoge", "fuga"), "piyo"))
@@ -148,6 +176,13 @@ def load_csv(path: str | Path | Iterable[str],
   CSVファイルを読み込んでDataFrameを返す。
   """
   fn = fullpath(path, *paths)
+  if HAS_PYARROW and "engine" not in aa:
+    # pyarrowエンジンはマルチスレッドで読み込む
+    # (非対応のオプションが渡された場合は既定エンジンにフォールバック)
+    try:
+      return pd.read_csv(fn, encoding=encoding, engine="pyarrow", **aa)
+    except (ValueError, TypeError):
+      pass
   return pd.read_csv(fn, encoding=encoding, **aa)
 
 def save_csv(df: pd.DataFrame, 
@@ -161,17 +196,59 @@ def save_csv(df: pd.DataFrame,
   """
   fn = fullpath(path, *paths)
   fn.parent.ensure_dir()
+  if (HAS_PYARROW and not aa and index == False
+      and encoding in (UTF8, UTF8BOM) and quoting == csv.QUOTE_ALL):
+    # pyarrowで一括書き出し(セル単位のPython処理を避ける)
+    try:
+      table = pa.Table.from_pandas(df, preserve_index=False)
+      with open(fn, "wb") as f:
+        if encoding == UTF8BOM:
+          f.write(b"\xef\xbb\xbf")
+        pacsv.write_csv(table, f, pacsv.WriteOptions(quoting_style="all_valid"))
+      return fn
+    except pa.ArrowException:
+      pass
   df.to_csv(fn, encoding=encoding, quoting=quoting, index=index, **aa)
   return fn
 
+def save_csv_rows(rows: Iterable, header: Iterable[str],
+                  path: str | Path | Iterable[str], *paths,
+                  encoding=UTF8BOM,
+                  quoting=csv.QUOTE_ALL,
+                  buffering=1 << 20) -> Path:
+  """
+  行のイテラブルを逐次CSVファイルに書き出す。
+  1行ずつ組み立てたデータをDataFrame化せずにそのまま保存できるため、
+  保存のためだけにDataFrameを作る場合はこちらを使う。
+  """
+  fn = fullpath(path, *paths)
+  fn.parent.ensure_dir()
+  with open(fn, "w", encoding=encoding, newline="", buffering=buffering) as f:
+    writer = csv.writer(f, quoting=quoting)
+    writer.writerow(header)
+    writer.writerows(rows)
+  return fn
+
 # df = pd.DataFrame({"a": [1, 2, 3], "b": [4, 5, 6]})
 # fn = fullpath("test").ensure_dir() / "test.csv"
 # save_csv(df, fn)
 # log(load_csv(fn))
 
-def num(d: int | float, spec=","): return format(d, spec) 
+def num(d: int | float, spec=","): return format(d, spec)
 def ymd(d: date, spec="%Y%m%d"): return d.strftime(spec)
 def hms(d: datetime, spec="%H%M%S"): return d.strftime(spec)
+def ymd_series(s: pd.Series, spec="%Y%m%d") -> pd.Series:
+  """
+  日付列を一括で文字列化する。
+  .apply(ymd)の代わりにこちらを使う(列全体を1回のC実装で処理する)。
+  """
+  return pd.to_datetime(s).dt.strftime(spec)
+def hms_series(s: pd.Series, spec="%H%M%S") -> pd.Series:
+  """
+  時刻列を一括で文字列化する。
+  .apply(hms)の代わりにこちらを使う。
+  """
+  return pd.to_datetime(s).dt.strftime(spec)
 def ymds_of(st: date|Iterable[date], ed: date = None, spec="%Y%m%d", sep=BAR) -> str:
   if isinstance(st, Iterable):
     st, ed = st 
@@ -185,15 +262,17 @@ def ymds_of(st: date|Iterable[date], ed: date = None, spec="%Y%m%d", sep=BAR) ->
 # log(hms(datetime(2025, 1, 1, 12, 34, 56)))
 # log(ymds_of(date(2025, 1, 1), date(2025, 12, 31)))
 
+_commafmt = "{:,}".format
+
 def step_of(index: int, total: any, sep=PER) -> str:
   """
   インデックスと総数を進捗率として表示する。
   """
-  if hasattr(total, "__len__"):
+  if not isinstance(total, int):
     # 総数がイテラブルの場合は、総数の長さを総数とする。
     total = len(total)
-    index = index + 1 
-  return join(num(index), num(total), sep=sep)
+    index = index + 1
+  return f"{_commafmt(index)}{sep}{_commafmt(total)}"
 
 # log(step_of(1234, 12345))
 # log(step_of(1234, range(12345)))
@@ -207,32 +286,30 @@ def months_of(st: Iterable[date] | date, ed: date = None, strict=True) -> Iterab
   ブロックの開始日と終了日を開始日と終了日に変更する。
   """
   if isinstance(st, Iterable):
-    st, ed = st 
-  elif isinstance(st, date) and ed is None: 
-    ed = st 
-  stt = st + delta(day=1)
-  edd = ed + delta(day=31)
-  diff = delta(edd, stt).months 
-  log(st, RIGHT, stt)
-  log(ed, LEFT, edd)
-  log(diff)
-  months = list(
-    tuple(stt + delta(months=x, day=y) 
-     for y in (1, 31)) 
-     for x in range(diff + 1)
-     )
+    st, ed = st
+  elif isinstance(st, date) and ed is None:
+    ed = st
+  # relativedeltaのオブジェクト生成を避け、(year*12+month)の整数演算で月を列挙する
+  m0 = st.year * 12 + st.month - 1
+  m1 = ed.year * 12 + ed.month - 1
+  months = []
+  for m in range(m0, m1 + 1):
+    y, mo = divmod(m, 12)
+    mo = mo + 1
+    months.append((date(y, mo, 1), date(y, mo, calendar.monthrange(y, mo)[1])))
   if strict:
     # 開始日と終了日がブロックの中にある場合は、
-    # ブロックの開始日と終了日を開始日と終了日に変更する。  
-    months[0] = (max(st, stt), months[0][-1])
-    months[-1] = (months[-1][0], min(ed, edd))
-  return months 
+    # ブロックの開始日と終了日を開始日と終了日に変更する。
+    months[0] = (max(st, months[0][0]), months[0][-1])
+    months[-1] = (months[-1][0], min(ed, months[-1][-1]))
+  return months
 
 # log(months_of(date(2025, 1, 1), date(2025, 12, 31)))
 # log(months_of(date(2025, 1, 1)))
 # log(months_of((date(2025, 1, 1), date(2025, 12, 31))))
 
-FISCAL_YEAR_START = 4 
+FISCAL_YEAR_START = 4
+@lru_cache(maxsize=4096)
 def fiscal_year_of(d: date=date.today(), start=FISCAL_YEAR_START, end=12) -> tuple[date, date]:
   """`
   会計年度の開始日と終了日を返す。
@@ -247,5 +324,33 @@ def fiscal_year_of(d: date=date.today(), start=FISCAL_YEAR_START, end=12) -> tup
 # for d in (date.today() + delta(months=x) for x in range(14)):
 #   log(d, fiscal_year_of(d))
 
+# from utilities.common import * で公開する名前
+# (importしただけでpd/np以外の内部importまで流出しないようにする)
+__all__ = [
+  # 再エクスポートするモジュール・オブジェクト
+  "pd", "np", "date", "datetime", "delta", "relativedelta", "log",
+  # 記号定数
+  "SP", "DOT", "COMMA", "COLON", "SEMICOLON", "SLASH", "BACKSLASH", "BACKQUOTE",
+  "PLUS", "MINUS", "ASTERISK", "CARET",
+  "ATSIGN", "PERCENT", "AMPERSAND", "DOLLAR",
+  "UNDERSCORE", "TILDE", "HASH", "VBAR", "QUESTION",
+  "EQUAL", "NOT", "LT", "GT", "LTE", "GTE",
+  "EQ", "SQ", "DQ",
+  "UNDER", "PER", "BAR",
+  "SHARP", "AT",
+  "PARENS", "BRACKETS", "BRACES",
+  "LEFT", "RIGHT", "TOP", "BOTTOM",
+  # エンコーディング
+  "UTF8", "UTF16", "UTF8BOM", "SJIS", "HAS_PYARROW",
+  # 文字列ヘルパー
+  "join", "sand", "sq", "dq", "paren", "bracket", "brace",
+  "comma", "bar", "under", "per", "dot", "and_", "or_", "xor", "not_",
+  # パス・CSV
+  "Path", "fullpath", "load_csv", "save_csv", "save_csv_rows",
+  # 日付・数値
+  "num", "ymd", "hms", "ymd_series", "hms_series", "ymds_of",
+  "step_of", "months_of", "FISCAL_YEAR_START", "fiscal_year_of",
+]
+
 
 
@@ -2,13 +2,27 @@
 スラッシュで区切られた文字列リストからDataFrameを作成するユーティリティ
 """
 from utilities.common import SLASH
+from collections import deque
 from typing import List
+import re
 import pandas as pd
+import numpy as np
+
+# 区切り文字ごとにコンパイル済みの「区切りの連続」パターンを使い回す
+_multi_sep = {}
 
 class TreeDF:
   """
   スラッシュで区切られた文字列リストからDataFrameを作成するクラス
   """
+  DTYPES = {
+    'id': 'int32',
+    'parent_id': 'int32',
+    'level': 'int8',
+    'code': 'category',
+    'name': 'category',
+    'path': 'category'
+  }
   def __init__(self, paths: List[str] = None, target_field: str = "dept", separator: str = SLASH):
     """
     コンストラクタ
@@ -29,12 +43,36 @@ class TreeDF:
       'path': pd.Series(dtype='category')
     })
     
+    self._build_indexes()
     if paths is not None:
       self.paths_to_df(paths, self.target_field)
-  
+
   # ツリー構造をDataFrameに変換
   def to_df(self) -> pd.DataFrame:
     return self.df
+
+  def _build_indexes(self) -> None:
+    """
+    id→行、parent_id→子行位置の索引を構築する
+    (ノードアクセスのたびにブールマスクで全行を走査しないため)
+    """
+    self._by_id = self.df.set_index('id', drop=False)
+    self._children = self.df.groupby('parent_id', observed=True).indices
+    # path昇順に並べた補助索引(子孫はソート済みパスの連続区間になる)
+    paths = self.df['path'].astype(str).to_numpy(dtype=str)
+    self._path_order = np.argsort(paths)
+    self._paths_sorted = paths[self._path_order]
+
+  def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    構築済みの列値からCategoricalDtypeを直接作って型付けする
+    (astype('category')による値の再走査を避け、作った型は再利用のため保持する)
+    """
+    dtypes = dict(self.DTYPES)
+    for col in ('code', 'name', 'path'):
+      dtypes[col] = pd.CategoricalDtype(df[col].unique())
+    self._dtypes = dtypes
+    return df.astype(dtypes)
   
   def paths_to_df(self, paths: List[str], target_field: str = "dept") -> pd.DataFrame:
     """
@@ -45,55 +83,129 @@ class TreeDF:
       target_field: コードとして使用するフィールド名
     """
     # パスの前処理
-    processed_paths = []
-    for path in paths:
-      if len(path.strip()) == 0:
-        continue
-      path = self.separator.join(filter(None, path.strip(self.separator).split(self.separator)))
-      if len(path) > 0:
-        processed_paths.append(path)
-    
+    # (split+filter+joinの3パスではなく、コンパイル済み正規表現の1パスで
+    # 連続した区切り文字をまとめてから端の区切りを落とす)
+    pat = _multi_sep.setdefault(
+      self.separator, re.compile(re.escape(self.separator) + '+'))
+    processed_paths = [
+      p for p in (pat.sub(self.separator, x).strip(self.separator)
+                  for x in paths if x.strip())
+      if p
+    ]
+
     if len(processed_paths) == 0:
       return self.df
     
-    # すべてのノードを収集
-    all_nodes = {}
-    for path in processed_paths:
-      parts = path.split(self.separator)
-      for i, part in enumerate(parts):
-        if part not in all_nodes:
-          all_nodes[part] = {
-            'code': part,
-            'name': part,
-            'level': i + 1,
-            'path': self.separator.join(parts[:i+1])
-          }
-    
-    # ノードIDのマッピングを作成
-    node_id_map = {code: idx + 1 for idx, code in enumerate(all_nodes.keys())}
-    
-    # DataFrameの作成
-    for code, node in all_nodes.items():
-      # 
-      parts = node['path'].split(self.separator)
-      parent_code = parts[-2] if len(parts) > 1 else None
-      parent_id = 0 if parent_code is None else node_id_map[parent_code]
-      
-      # ノードをDataFrameに追加
-      self.df = pd.concat([
-        self.df,
-        pd.DataFrame([{
-          'id': node_id_map[code],
-          'code': node['code'],
-          'name': node['name'],
-          'parent_id': parent_id,
-          'level': node['level'],
-          'path': node['path']
-        }])
-      ], ignore_index=True)
-    
+    # パスを展開して全ノードをベクトル演算で導出する
+    # (Pythonループの代わりにpandasの文字列演算でlevel/path/parentを一括計算)
+    s = pd.Series(processed_paths).str.split(self.separator)
+    df = s.explode().rename('code').to_frame()
+    df['level'] = df.groupby(level=0).cumcount() + 1
+    df['path'] = s.apply(
+      lambda parts: [self.separator.join(parts[:i+1]) for i in range(len(parts))]
+    ).explode()
+
+    # コードの初出のみを残してIDを振る
+    df = df.drop_duplicates('code').reset_index(drop=True)
+    df['id'] = df.index + 1
+    df['name'] = df['code']
+
+    # 親コードはパスの末尾を落として求め、ID表で引く(ルートは0)
+    node_id_map = {code: idx + 1 for idx, code in enumerate(df['code'])}
+    parent_code = df['path'].str.split(self.separator).str[-2].where(df['level'] > 1)
+    df['parent_id'] = parent_code.map(node_id_map).fillna(0)
+
+    self.df = self._typed(df[['id', 'code', 'name', 'parent_id', 'level', 'path']])
+    self._build_indexes()
+
     return self.df
-  
+
+  def tree_to_df(self, tree: dict | List[dict]) -> pd.DataFrame:
+    """
+    ネストした辞書のツリーからDataFrameを生成
+
+    Args:
+      tree: {'code': ..., 'name': ..., 'children': [...]} 形式のツリー
+            (ルートが複数ある場合はリストでも可)
+    """
+    roots = tree if isinstance(tree, list) else [tree]
+
+    # 1回目の走査でノード数を数える
+    stack = deque(roots)
+    n = 0
+    while stack:
+      node = stack.pop()
+      n += 1
+      stack.extend(node.get('children', []))
+
+    if n == 0:
+      return self.df
+
+    # 列ごとに型付き配列を1回だけ確保し、2回目の走査で位置指定で埋める
+    # (行辞書のリストを経由するより割り当てが少ない)
+    ids = np.empty(n, 'int32')
+    pids = np.empty(n, 'int32')
+    lvls = np.empty(n, 'int8')
+    codes = [None] * n
+    names = [None] * n
+    paths = [None] * n
+
+    # 再帰ではなく明示的なスタックで深さ優先に走査する
+    stack = deque((root, 0, '', 1) for root in reversed(roots))
+    i = 0
+    while stack:
+      node, parent_id, parent_path, level = stack.pop()
+      code = node['code']
+      path = code if parent_path == '' else parent_path + self.separator + code
+      current_id = i + 1
+      ids[i] = current_id
+      pids[i] = parent_id
+      lvls[i] = level
+      codes[i] = code
+      names[i] = node.get('name', code)
+      paths[i] = path
+      i += 1
+      # reversedで積むことで自然な順序のまま取り出せる
+      for child in reversed(node.get('children', [])):
+        stack.append((child, current_id, path, level + 1))
+
+    df = self._typed(pd.DataFrame({
+      'id': ids,
+      'code': codes,
+      'name': names,
+      'parent_id': pids,
+      'level': lvls,
+      'path': paths
+    }))
+    # タイムスタンプはノードごとに取得せず、1回だけ取得して全行に入れる
+    df['created_at'] = df['updated_at'] = pd.Timestamp.now()
+    self.df = df
+    self._build_indexes()
+
+    return self.df
+
+  def df_to_tree(self) -> List[dict]:
+    """
+    DataFrameからネストした辞書のツリーを復元する
+    (tree_to_dfの逆変換。ルートが複数ある場合を考慮してリストで返す)
+    """
+    # 再帰の中でDataFrameを触らないよう、先に辞書の索引を1回の走査で作る
+    by_id = {}
+    by_parent = {}
+    for r in self.df.itertuples(index=False):
+      by_id[r.id] = r
+      by_parent.setdefault(r.parent_id, []).append(r.id)
+
+    def build_node(node_id: int) -> dict:
+      row = by_id[node_id]
+      return {
+        'code': row.code,
+        'name': row.name,
+        'children': [build_node(c) for c in by_parent.get(node_id, [])]
+      }
+
+    return [build_node(node_id) for node_id in by_parent.get(0, [])]
+
   def display_tree(self, show_code: bool = True, printer=print) -> None:
     """
     ツリー構造を視覚的に表示
@@ -103,24 +215,73 @@ class TreeDF:
     """
     def display_node(node_id: int, prefix: str = '', is_last: bool = True) -> None:
       """ノードを表示"""
-      node = self.df[self.df['id'] == node_id].iloc[0]
-      children = self.df[self.df['parent_id'] == node_id]
-      
+      node = self._by_id.loc[node_id]
+      children = self.get_children(node_id)
+
       # 現在のノードの表示
       current_prefix = prefix + ('└─ ' if is_last else '├─ ')
       node_display = f"{node['code']} ({node['name']})" if show_code else node['name']
       printer(current_prefix + node_display)
-      
+
       # 子ノードの表示
       child_prefix = prefix + ('   ' if is_last else '│   ')
       for i, (_, child) in enumerate(children.iterrows()):
         display_node(child['id'], child_prefix, i == len(children) - 1)
-    
+
     # ルートノードを表示
-    roots = self.df[self.df['parent_id'] == 0]
+    roots = self.get_children(0)
     for i, (_, root) in enumerate(roots.iterrows()):
       display_node(root['id'], '', i == len(roots) - 1)
 
+  def get_children(self, node_id: int) -> pd.DataFrame:
+    """指定ノードの子ノードを返す"""
+    return self.df.iloc[self._children.get(node_id, [])]
+
+  def get_descendants(self, node_id: int) -> pd.DataFrame:
+    """指定ノードの子孫ノードをすべて返す"""
+    # 全行のstartswith走査ではなく、ソート済みパスの二分探索で
+    # 子孫の連続区間だけを取り出す
+    prefix = str(self._by_id.at[node_id, 'path']) + self.separator
+    lo = np.searchsorted(self._paths_sorted, prefix)
+    hi = np.searchsorted(self._paths_sorted, prefix + '\uffff')
+    return self.df.iloc[np.sort(self._path_order[lo:hi])]
+
+  def get_ancestors(self, node_id: int) -> pd.DataFrame:
+    """指定ノードの祖先ノードをルートから順に返す"""
+    ids = []
+    parent_id = self._by_id.at[node_id, 'parent_id']
+    while parent_id != 0:
+      ids.append(parent_id)
+      parent_id = self._by_id.at[parent_id, 'parent_id']
+    return self._by_id.loc[ids[::-1]].reset_index(drop=True)
+
+  def get_siblings(self, node_id: int) -> pd.DataFrame:
+    """指定ノードの兄弟ノードを返す(自分自身は含まない)"""
+    parent_id = self._by_id.at[node_id, 'parent_id']
+    siblings = self.df.iloc[self._children.get(parent_id, [])]
+    return siblings[siblings['id'] != node_id]
+
+  def validate(self) -> bool:
+    """
+    ツリー構造の整合性を検証する
+    (levelが親のlevel+1であること、pathが親のpathで始まることを
+    行ループではなくベクトル演算で一括確認する)
+    """
+    if len(self.df) == 0:
+      return True
+    # 親の列を自己マージで横付けして一括比較する
+    m = self.df.merge(
+      self.df[['id', 'level', 'path']].rename(
+        columns={'id': 'parent_id', 'level': 'p_level', 'path': 'p_path'}),
+      on='parent_id', how='left')
+    root = m['parent_id'] == 0
+    lvl_ok = root | (m['level'] == m['p_level'] + 1)
+    path_ok = root | np.char.startswith(
+      m['path'].astype(str).to_numpy(dtype=str),
+      (m['p_path'].astype(str) + self.separator).to_numpy(dtype=str))
+    parents_exist = root | m['parent_id'].isin(m['id'])
+    return bool(lvl_ok.all() and path_ok.all() and parents_exist.all())
+
 # 使用例
 if __name__ == "__main__":
   paths = ['A/B/C', 'A/B/D', 'A/E/F', 'X/Y/Z', 'X/Y/W']